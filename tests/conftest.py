@@ -4,26 +4,33 @@ import openai
 import pytest
 import rich.console
 
+from user_preferences_agent import UserPreferencesAgent
+
 lbt.set_logger("openai_usage")
 lbt.set_logger("tests")
 lbt.set_logger("universal_message")
 lbt.set_logger("user_preferences_agent")
 
 
-@pytest.fixture(scope="module")
+@pytest.fixture(scope="session")
 def console():
     return rich.console.Console()
 
 
-@pytest.fixture(scope="module")
+@pytest.fixture(scope="session")
 def chat_model_str():
     return "gemma3n:e4b"
 
 
-@pytest.fixture(scope="module")
+@pytest.fixture(scope="session")
 def chat_model(chat_model_str: str):
     client = openai.AsyncOpenAI(
         base_url="http://localhost:11434/v1",
         api_key="ollama",
     )
     return agents.OpenAIChatCompletionsModel(model=chat_model_str, openai_client=client)
+
+
+@pytest.fixture(scope="session")
+def up_agent():
+    return UserPreferencesAgent()
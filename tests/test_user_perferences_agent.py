@@ -1,4 +1,5 @@
 # tests/test_user_perferences_agent.py
+import concurrent.futures
 import pathlib
 import typing
 
@@ -6,27 +7,126 @@ import agents
 import pytest
 import rich.console
 import universal_message as um
+from google_language_support import LanguageCodes
 
 from user_preferences_agent import UserPreferencesAgent
 
 TEST_CASES_DIR = pathlib.Path(__file__).parent.joinpath("chats")
-TEST_CASES: typing.List[typing.Tuple[str, typing.List[um.Message]]] = [
-    (file.name, um.Message.from_text(file.read_text()))
-    for file in TEST_CASES_DIR.glob("*.txt")
-]
+TEST_CASES: typing.List[pathlib.Path] = sorted(TEST_CASES_DIR.glob("*.txt"))
+
+
+@pytest.fixture(scope="session")
+def chat_messages() -> typing.Dict[str, typing.List[um.Message]]:
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        texts = executor.map(pathlib.Path.read_text, TEST_CASES)
+        return {
+            file.name: um.Message.from_text(text)
+            for file, text in zip(TEST_CASES, texts)
+        }
 
 
 @pytest.mark.asyncio
-@pytest.mark.parametrize("file_name, messages", TEST_CASES)
+@pytest.mark.parametrize("file_name", [file.name for file in TEST_CASES])
 async def test_user_preferences_agent(
     file_name: str,
-    messages: typing.List[um.Message],
+    chat_messages: typing.Dict[str, typing.List[um.Message]],
     chat_model: agents.OpenAIChatCompletionsModel | agents.OpenAIResponsesModel,
     console: rich.console.Console,
+    up_agent: UserPreferencesAgent,
 ):
-    up_agent = UserPreferencesAgent()
+    messages = chat_messages[file_name]
     result = await up_agent.run(messages, model=chat_model, verbose=True)
     assert result.user_preferences.language
     assert result.user_preferences.rules_and_memories
-    assert len(result.usages) == 2
+    assert len(result.usages) == 1
     assert sum(usage.cost or 0.0 for usage in result.usages) > 0
+
+
+@pytest.mark.asyncio
+async def test_user_preferences_agent_unbatched(
+    chat_messages: typing.Dict[str, typing.List[um.Message]],
+    chat_model: agents.OpenAIChatCompletionsModel | agents.OpenAIResponsesModel,
+    up_agent: UserPreferencesAgent,
+):
+    messages = chat_messages[TEST_CASES[0].name]
+    result = await up_agent.run(messages, model=chat_model, batched=False)
+    assert result.user_preferences.language
+    assert result.user_preferences.rules_and_memories
+    assert len(result.usages) == 2
+
+
+def test_parse_user_preferences_combined_with_tags(up_agent: UserPreferencesAgent):
+    user_preferences = up_agent._parse_user_preferences_combined(
+        " [English](#en)\n"
+        "[task=rules]\n"
+        "rule: The user's name is Alex.\n"
+        "rule: The user's favorite color is blue.\n"
+        "[DONE]"
+    )
+    assert user_preferences.language == LanguageCodes.from_might_common_name("en")
+    assert user_preferences.rules_and_memories == [
+        "The user's name is Alex.",
+        "The user's favorite color is blue.",
+    ]
+
+
+def test_parse_user_preferences_combined_without_tags(
+    up_agent: UserPreferencesAgent,
+):
+    user_preferences = up_agent._parse_user_preferences_combined(
+        "[Japanese](#ja)\nrule: The user wants responses in Japanese.\n[DONE]"
+    )
+    assert user_preferences.language == LanguageCodes.from_might_common_name("ja")
+    assert user_preferences.rules_and_memories == [
+        "The user wants responses in Japanese."
+    ]
+
+
+def test_parse_user_preferences_combined_repeated_language_tag(
+    up_agent: UserPreferencesAgent,
+):
+    user_preferences = up_agent._parse_user_preferences_combined(
+        "\n"
+        "[task=language]\n"
+        "language: [French](#fr)\n"
+        "[task=rules]\n"
+        "rule: The user has a reservation for two.\n"
+        "[DONE]"
+    )
+    assert user_preferences.language == LanguageCodes.from_might_common_name("fr")
+    assert user_preferences.rules_and_memories == [
+        "The user has a reservation for two."
+    ]
+
+
+def test_parse_user_preferences_combined_repeated_rules_tag(
+    up_agent: UserPreferencesAgent,
+):
+    user_preferences = up_agent._parse_user_preferences_combined(
+        " [German](#de)\n"
+        "[task=rules]\n"
+        "rule: The user lives in Berlin.\n"
+        "[task=rules]\n"
+        "rule: The user prefers trains.\n"
+        "[DONE]"
+    )
+    assert user_preferences.language == LanguageCodes.from_might_common_name("de")
+    assert user_preferences.rules_and_memories == [
+        "The user lives in Berlin.",
+        "The user prefers trains.",
+    ]
+
+
+def test_parse_user_preferences_combined_rules_none(up_agent: UserPreferencesAgent):
+    user_preferences = up_agent._parse_user_preferences_combined(
+        " [Spanish](#es)\n[task=rules]\nrule: None\n[DONE]"
+    )
+    assert user_preferences.language == LanguageCodes.from_might_common_name("es")
+    assert user_preferences.rules_and_memories == []
+
+
+def test_parse_user_preferences_language_without_match(
+    up_agent: UserPreferencesAgent,
+):
+    user_preferences = up_agent._parse_user_preferences_language("no language here")
+    assert user_preferences.language is None
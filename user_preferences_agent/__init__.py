@@ -1,10 +1,14 @@
 # user_preferences_agent/__init__.py
 import asyncio
+import functools
 import logging
+import os
 import pathlib
+import pprint
 import re
 import textwrap
 import typing
+import weakref
 
 import agents
 import jinja2
@@ -34,6 +38,354 @@ SUPPORTED_MODEL_TYPES: typing.TypeAlias = (
     agents.OpenAIChatCompletionsModel | agents.OpenAIResponsesModel | ChatModel | str
 )
 
+_LANG_RE = re.compile(r"\[([^\]]+)\]\s*\(\s*#\s*([^)]+?)\s*\)", re.IGNORECASE)
+_RULE_RE = re.compile(r"^rule:\s*(.+)", re.MULTILINE | re.IGNORECASE)
+_TASK_TAG_RE = re.compile(r"^\s*\[task=(\w+)\]\s*$", re.MULTILINE | re.IGNORECASE)
+_NONE_TOKENS = frozenset({"none", "null"})
+
+_LANGUAGE_CODES_CSV = ", ".join(lang.value for lang in LanguageCodes)
+
+_JINJA_ENV = jinja2.Environment(autoescape=False)
+
+
+@functools.lru_cache(maxsize=32)
+def _get_template(source: str) -> jinja2.Template:
+    """Compile a prompt template once and reuse it across calls."""
+    return _JINJA_ENV.from_string(source)
+
+
+_LANG_PROMPT = textwrap.dedent(
+    """
+    ## Role Instructions
+
+    You are a User Experience Analyst.
+    You will be given a chat history between a user and a customer service agent.
+    Your task is to analyze the chat history and identify the user's preferred language.
+    The user's preferred language must be one of the reference languages.
+    Output the preferred language in the format [Language Name](#language_code).
+    The reference ISO 639-1 language codes are: {{ language_codes }}.
+
+    ## Examples
+
+    ### Example 1
+
+    user:
+    Hello, I'm John Doe.
+
+    assistant:
+    Hello, John Doe. How can I help you today?
+
+    user:
+    I'm looking for a new phone.
+
+    assistant:
+    Sure, I can help you with that.
+
+    analysis:
+    language: [English](#en)  # done
+
+    ### Example 2
+
+    user:
+    I want to know the weather in Tokyo.
+
+    assistant:
+    The weather in Tokyo is sunny.
+
+    user:
+    Could you speak in Japanese?
+
+    assistant:
+    OK, I will speak in Japanese next time.
+
+    analysis:
+    language: [Japanese](#ja)  # done
+
+    ## Input Chat History
+
+    {{ messages_instructions }}
+
+    analysis:
+    language:
+    """  # noqa: E501
+).strip()
+
+
+_RULES_PROMPT = textwrap.dedent(
+    """
+    ## Role Instructions
+
+    You are a User Experience Analyst.
+    You will be given a chat history between a user and a customer service agent.
+    Your task is to read a chat history and extract specific rules, facts, or memories stated by the USER only.
+    Focus only on what the user says, ignore assistant responses when extracting rules.
+
+    ## Abstractive Proposition Segmentation (APS)
+
+    Each extracted rule or memory MUST follow Abstractive Proposition Segmentation (APS) principles.
+    APS is an analysis technique that breaks down text information into component parts.
+    This means each rule should be a single, atomic proposition that captures one specific piece of information.
+
+    ## Output Format Rules
+
+    - Each extracted piece of information MUST be on a new line.
+    - Each line MUST begin with the prefix `rule: `.
+    - Extract the information as a concise statement following APS principles.
+    - Each rule should contain only one atomic proposition or fact.
+    - If you find NO rules, facts, or memories, you MUST output exactly `rule: None`.
+    - Do NOT include conversational filler, greetings, or your own explanations.
+    - Only extract information from USER messages, not assistant responses.
+
+    ## Examples
+
+    ### Example 1
+
+    user:
+    My name is Alex.
+
+    assistant:
+    Nice to meet you, Alex.
+
+    user:
+    And my favorite color is blue.
+
+    analysis:
+    rule: The user's name is Alex.
+    rule: The user's favorite color is blue.
+    [DONE]
+
+    ### Example 2
+
+    user:
+    Please always respond in Spanish.
+
+    assistant:
+    Entendido. Responderé en español a partir de ahora.
+
+    analysis:
+    rule: The user wants responses in Spanish.
+    [DONE]
+
+    ### Example 3
+
+    user:
+    Can you tell me the weather?
+
+    assistant:
+    Of course. Where do you live?
+
+    user:
+    I'm in London.
+
+    analysis:
+    rule: The user is in London.
+    [DONE]
+
+    ### Example 4
+
+    user:
+    Hello!
+
+    assistant:
+    Hi there! How can I help?
+
+    analysis:
+    rule: None
+    [DONE]
+
+    ## Input Chat History
+
+    {{ messages_instructions }}
+
+    analysis:
+    """  # noqa: E501
+).strip()
+
+
+_COMBINED_PROMPT = textwrap.dedent(
+    """
+    ## Role Instructions
+
+    You are a User Experience Analyst.
+    You will be given a chat history between a user and a customer service agent.
+    You must complete two tasks on the same chat history and answer both in a single analysis.
+
+    ## Task: language
+
+    Identify the user's preferred language.
+    The user's preferred language must be one of the reference languages.
+    Output the preferred language in the format `language: [Language Name](#language_code)`.
+    The reference ISO 639-1 language codes are: {{ language_codes }}.
+
+    ## Task: rules
+
+    Extract specific rules, facts, or memories stated by the USER only.
+    Focus only on what the user says, ignore assistant responses when extracting rules.
+    Each extracted rule or memory MUST follow Abstractive Proposition Segmentation (APS) principles.
+    APS is an analysis technique that breaks down text information into component parts.
+    This means each rule should be a single, atomic proposition that captures one specific piece of information.
+
+    - Each extracted piece of information MUST be on a new line.
+    - Each line MUST begin with the prefix `rule: `.
+    - Each rule should contain only one atomic proposition or fact.
+    - If you find NO rules, facts, or memories, you MUST output exactly `rule: None`.
+    - Do NOT include conversational filler, greetings, or your own explanations.
+
+    ## Output Format Rules
+
+    - Start the language task answer with the line `[task=language]`.
+    - Start the rules task answer with the line `[task=rules]`.
+    - End the analysis with the line `[DONE]`.
+
+    ## Examples
+
+    ### Example 1
+
+    user:
+    My name is Alex.
+
+    assistant:
+    Nice to meet you, Alex.
+
+    user:
+    And my favorite color is blue.
+
+    analysis:
+    [task=language]
+    language: [English](#en)
+    [task=rules]
+    rule: The user's name is Alex.
+    rule: The user's favorite color is blue.
+    [DONE]
+
+    ### Example 2
+
+    user:
+    I want to know the weather in Tokyo.
+
+    assistant:
+    The weather in Tokyo is sunny.
+
+    user:
+    Could you speak in Japanese?
+
+    assistant:
+    OK, I will speak in Japanese next time.
+
+    analysis:
+    [task=language]
+    language: [Japanese](#ja)
+    [task=rules]
+    rule: The user wants responses in Japanese.
+    [DONE]
+
+    ### Example 3
+
+    user:
+    Hello!
+
+    assistant:
+    Hi there! How can I help?
+
+    analysis:
+    [task=language]
+    language: [English](#en)
+    [task=rules]
+    rule: None
+    [DONE]
+
+    ## Input Chat History
+
+    {{ messages_instructions }}
+
+    analysis:
+    [task=language]
+    language:
+    """  # noqa: E501
+).strip()
+
+# Compile the default prompts at import so no run pays the parse cost.
+for _prompt in (_LANG_PROMPT, _RULES_PROMPT, _COMBINED_PROMPT):
+    _get_template(_prompt)
+del _prompt
+
+
+def _max_inflight() -> int:
+    """Read the UPA_MAX_INFLIGHT limit on concurrent LLM requests."""
+    raw = os.environ.get("UPA_MAX_INFLIGHT", "32")
+    if not raw.strip().isdigit() or int(raw) < 1:
+        raise ValueError(f"UPA_MAX_INFLIGHT must be a positive integer, got {raw!r}")
+    return int(raw)
+
+
+# One semaphore per event loop bounds in-flight LLM requests across every
+# agent in the process without binding the limit to a stale loop.
+_llm_semaphores: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, asyncio.Semaphore
+] = weakref.WeakKeyDictionary()
+
+
+def _get_llm_semaphore() -> asyncio.Semaphore:
+    """Return the in-flight LLM request semaphore for the running event loop."""
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        # A contended semaphore references its loop, which keeps the weak key
+        # alive, so drop entries for loops that have already closed.
+        for stale_loop in [key for key in _llm_semaphores if key.is_closed()]:
+            del _llm_semaphores[stale_loop]
+        semaphore = _llm_semaphores[loop] = asyncio.Semaphore(_max_inflight())
+    return semaphore
+
+
+def _to_messages(
+    messages: list[um.SUPPORTED_MESSAGE_TYPES] | list[um.Message],
+) -> list[um.Message]:
+    """Convert inputs to messages, passing through ones that already are."""
+    return [
+        msg if isinstance(msg, um.Message) else um.Message.from_any(msg)
+        for msg in messages
+    ]
+
+
+def _to_usage(
+    result: agents.RunResult,
+    chat_model: agents.OpenAIChatCompletionsModel | agents.OpenAIResponsesModel,
+) -> Usage:
+    """Build the usage of an agent run, priced for the model that served it."""
+    usage = Usage.from_openai(result.context_wrapper.usage)
+    usage.model = chat_model.model
+    usage.cost = usage.estimate_cost(usage.model)
+    return usage
+
+
+def _render_verbose(
+    console: rich.console.Console,
+    color_rotator: RichColorRotator,
+    width: int,
+    *,
+    instructions: str | None = None,
+    output: str | None = None,
+    usage: Usage | None = None,
+) -> None:
+    """Print the given LLM instructions, output and usage as rich panels."""
+    panels = (
+        ("LLM INSTRUCTIONS", instructions),
+        ("LLM OUTPUT", output),
+        ("LLM USAGE", None if usage is None else pprint.pformat(usage.model_dump())),
+    )
+    for title, content in panels:
+        if content is None:
+            continue
+        console.print(
+            rich.panel.Panel(
+                rich.text.Text(content),
+                title=title,
+                border_style=color_rotator.pick(),
+                width=width,
+            )
+        )
+
 
 class UserPreferences(pydantic.BaseModel):
     """Represents all user-configurable preferences."""
@@ -89,151 +441,39 @@ class UserPreferences(pydantic.BaseModel):
 
 
 class UserPreferencesAgent:
-    instructions_analyze_language_j2: str = textwrap.dedent(
-        """
-        ## Role Instructions
-
-        You are a User Experience Analyst.
-        You will be given a chat history between a user and a customer service agent.
-        Your task is to analyze the chat history and identify the user's preferred language.
-        The user's preferred language must be one of the reference languages.
-        Output the preferred language in the format [Language Name](#language_code).
-        The reference ISO 639-1 language codes are: {{ language_codes }}.
-
-        ## Examples
-
-        ### Example 1
-
-        user:
-        Hello, I'm John Doe.
-
-        assistant:
-        Hello, John Doe. How can I help you today?
-
-        user:
-        I'm looking for a new phone.
+    instructions_analyze_language_j2: str = _LANG_PROMPT
+    instructions_rules_and_memories_j2: str = _RULES_PROMPT
+    instructions_analyze_combined_j2: str = _COMBINED_PROMPT
 
-        assistant:
-        Sure, I can help you with that.
+    # Cached agents keep their chat model alive, so bound the cache in case
+    # callers pass a fresh model object on every run.
+    max_cached_agents: int = 32
 
-        analysis:
-        language: [English](#en)  # done
+    def __init__(self) -> None:
+        self._agents: typing.Dict[typing.Tuple[str, int], agents.Agent] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._openai_client: openai.AsyncOpenAI | None = None
+        self._responses_models: typing.Dict[str, agents.OpenAIResponsesModel] = {}
 
-        ### Example 2
-
-        user:
-        I want to know the weather in Tokyo.
-
-        assistant:
-        The weather in Tokyo is sunny.
-
-        user:
-        Could you speak in Japanese?
-
-        assistant:
-        OK, I will speak in Japanese next time.
-
-        analysis:
-        language: [Japanese](#ja)  # done
-
-        ## Input Chat History
+    async def __aenter__(self) -> typing.Self:
+        return self
 
-        {{ messages_instructions }}
+    async def __aexit__(self, *exc_info: typing.Any) -> None:
+        await self.aclose()
 
-        analysis:
-        language:
-        """  # noqa: E501
-    ).strip()
+    async def aclose(self) -> None:
+        """Close this agent's OpenAI client and drop its cached models and agents.
 
-    instructions_rules_and_memories_j2: str = textwrap.dedent(
+        The pooled client belongs to the agent, so reuse one agent across calls
+        to keep connections alive, and call aclose() when done with it.
         """
-        ## Role Instructions
-
-        You are a User Experience Analyst.
-        You will be given a chat history between a user and a customer service agent.
-        Your task is to read a chat history and extract specific rules, facts, or memories stated by the USER only.
-        Focus only on what the user says, ignore assistant responses when extracting rules.
-
-        ## Abstractive Proposition Segmentation (APS)
-
-        Each extracted rule or memory MUST follow Abstractive Proposition Segmentation (APS) principles.
-        APS is an analysis technique that breaks down text information into component parts.
-        This means each rule should be a single, atomic proposition that captures one specific piece of information.
-
-        ## Output Format Rules
-
-        - Each extracted piece of information MUST be on a new line.
-        - Each line MUST begin with the prefix `rule: `.
-        - Extract the information as a concise statement following APS principles.
-        - Each rule should contain only one atomic proposition or fact.
-        - If you find NO rules, facts, or memories, you MUST output exactly `rule: None`.
-        - Do NOT include conversational filler, greetings, or your own explanations.
-        - Only extract information from USER messages, not assistant responses.
-
-        ## Examples
-
-        ### Example 1
-
-        user:
-        My name is Alex.
-
-        assistant:
-        Nice to meet you, Alex.
-
-        user:
-        And my favorite color is blue.
-
-        analysis:
-        rule: The user's name is Alex.
-        rule: The user's favorite color is blue.
-        [DONE]
-
-        ### Example 2
-
-        user:
-        Please always respond in Spanish.
-
-        assistant:
-        Entendido. Responderé en español a partir de ahora.
-
-        analysis:
-        rule: The user wants responses in Spanish.
-        [DONE]
-
-        ### Example 3
-
-        user:
-        Can you tell me the weather?
-
-        assistant:
-        Of course. Where do you live?
-
-        user:
-        I'm in London.
-
-        analysis:
-        rule: The user is in London.
-        [DONE]
-
-        ### Example 4
-
-        user:
-        Hello!
-
-        assistant:
-        Hi there! How can I help?
-
-        analysis:
-        rule: None
-        [DONE]
-
-        ## Input Chat History
-
-        {{ messages_instructions }}
-
-        analysis:
-        """  # noqa: E501
-    ).strip()
+        client, self._openai_client = self._openai_client, None
+        self._responses_models.clear()
+        self._agents.clear()
+        # Pooled connections can only be closed on the loop that opened them.
+        if client is not None and self._loop is asyncio.get_running_loop():
+            await client.close()
+        self._loop = None
 
     async def analyze_language(
         self,
@@ -247,62 +487,17 @@ class UserPreferencesAgent:
         width: int = 80,
         **kwargs,
     ) -> "UserPreferencesResult":
-        msgs = [um.Message.from_any(msg) for msg in messages]
-        chat_model = self._to_chat_model(model)
-
-        agent_instructions_template = jinja2.Template(
-            self.instructions_analyze_language_j2
-        )
-        user_input = agent_instructions_template.render(
-            language_codes=", ".join(lang.value for lang in LanguageCodes),
+        msgs = _to_messages(messages)
+        return await self._analyze_language(
+            msgs,
             messages_instructions=um.messages_to_instructions(msgs),
-        )
-
-        if verbose:
-            __rich_panel = rich.panel.Panel(
-                rich.text.Text(user_input),
-                title="LLM INSTRUCTIONS",
-                border_style=color_rotator.pick(),
-                width=width,
-            )
-            console.print(__rich_panel)
-
-        agent = agents.Agent(
-            name="user-preferences-agent-analyze-language",
-            model=chat_model,
-            model_settings=agents.ModelSettings(temperature=0.0),
-        )
-        result = await agents.Runner.run(
-            agent,
-            user_input,
-            run_config=agents.RunConfig(tracing_disabled=tracing_disabled),
-        )
-        usage = Usage.from_openai(result.context_wrapper.usage)
-        usage.model = chat_model.model
-        usage.cost = usage.estimate_cost(usage.model)
-
-        if verbose:
-            __rich_panel = rich.panel.Panel(
-                rich.text.Text(str(result.final_output)),
-                title="LLM OUTPUT",
-                border_style=color_rotator.pick(),
-                width=width,
-            )
-            console.print(__rich_panel)
-            __rich_panel = rich.panel.Panel(
-                rich.text.Text(usage.model_dump_json(indent=4)),
-                title="LLM USAGE",
-                border_style=color_rotator.pick(),
-                width=width,
-            )
-            console.print(__rich_panel)
-
-        return UserPreferencesResult(
-            input_messages=msgs,
-            user_preferences=self._parse_user_preferences_language(
-                str(result.final_output)
-            ),
-            usages=[usage],
+            chat_model=self._to_chat_model(model),
+            tracing_disabled=tracing_disabled,
+            verbose=verbose,
+            console=console,
+            color_rotator=color_rotator,
+            width=width,
+            **kwargs,
         )
 
     async def analyze_rules_and_memories(
@@ -317,61 +512,43 @@ class UserPreferencesAgent:
         width: int = 80,
         **kwargs,
     ) -> "UserPreferencesResult":
-        msgs = [um.Message.from_any(msg) for msg in messages]
-        chat_model = self._to_chat_model(model)
-
-        agent_instructions_template = jinja2.Template(
-            self.instructions_rules_and_memories_j2
-        )
-        user_input = agent_instructions_template.render(
+        msgs = _to_messages(messages)
+        return await self._analyze_rules_and_memories(
+            msgs,
             messages_instructions=um.messages_to_instructions(msgs),
+            chat_model=self._to_chat_model(model),
+            tracing_disabled=tracing_disabled,
+            verbose=verbose,
+            console=console,
+            color_rotator=color_rotator,
+            width=width,
+            **kwargs,
         )
 
-        if verbose:
-            __rich_panel = rich.panel.Panel(
-                rich.text.Text(user_input),
-                title="LLM INSTRUCTIONS",
-                border_style=color_rotator.pick(),
-                width=width,
-            )
-            console.print(__rich_panel)
-
-        agent = agents.Agent(
-            name="user-preferences-agent-rules-and-memories",
-            model=chat_model,
-            model_settings=agents.ModelSettings(temperature=0.0),
-        )
-        result = await agents.Runner.run(
-            agent,
-            user_input,
-            run_config=agents.RunConfig(tracing_disabled=tracing_disabled),
-        )
-        usage = Usage.from_openai(result.context_wrapper.usage)
-        usage.model = chat_model.model
-        usage.cost = usage.estimate_cost(usage.model)
-
-        if verbose:
-            __rich_panel = rich.panel.Panel(
-                rich.text.Text(str(result.final_output)),
-                title="LLM OUTPUT",
-                border_style=color_rotator.pick(),
-                width=width,
-            )
-            console.print(__rich_panel)
-            __rich_panel = rich.panel.Panel(
-                rich.text.Text(usage.model_dump_json(indent=4)),
-                title="LLM USAGE",
-                border_style=color_rotator.pick(),
-                width=width,
-            )
-            console.print(__rich_panel)
-
-        return UserPreferencesResult(
-            input_messages=msgs,
-            user_preferences=self._parse_user_preferences_rules_and_memories(
-                str(result.final_output)
-            ),
-            usages=[usage],
+    async def analyze_combined(
+        self,
+        messages: list[um.SUPPORTED_MESSAGE_TYPES] | list[um.Message],
+        *,
+        model: typing.Optional[SUPPORTED_MODEL_TYPES] = None,
+        tracing_disabled: bool = True,
+        verbose: bool = False,
+        console: rich.console.Console = console,
+        color_rotator: RichColorRotator = color_rotator,
+        width: int = 80,
+        **kwargs,
+    ) -> "UserPreferencesResult":
+        """Analyze language and rules in one LLM call sharing the chat history."""
+        msgs = _to_messages(messages)
+        return await self._analyze_combined(
+            msgs,
+            messages_instructions=um.messages_to_instructions(msgs),
+            chat_model=self._to_chat_model(model),
+            tracing_disabled=tracing_disabled,
+            verbose=verbose,
+            console=console,
+            color_rotator=color_rotator,
+            width=width,
+            **kwargs,
         )
 
     async def run(
@@ -384,15 +561,31 @@ class UserPreferencesAgent:
         console: rich.console.Console = console,
         color_rotator: RichColorRotator = color_rotator,
         width: int = 80,
+        batched: bool = True,
         **kwargs,
     ) -> "UserPreferencesResult":
-        msgs = [um.Message.from_any(msg) for msg in messages]
+        msgs = _to_messages(messages)
         chat_model = self._to_chat_model(model)
+        messages_instructions = um.messages_to_instructions(msgs)
+
+        if batched:
+            return await self._analyze_combined(
+                msgs,
+                messages_instructions=messages_instructions,
+                chat_model=chat_model,
+                tracing_disabled=tracing_disabled,
+                verbose=verbose,
+                console=console,
+                color_rotator=color_rotator,
+                width=width,
+                **kwargs,
+            )
 
         results = await asyncio.gather(
-            self.analyze_language(
+            self._analyze_language(
                 msgs,
-                model=chat_model,
+                messages_instructions=messages_instructions,
+                chat_model=chat_model,
                 tracing_disabled=tracing_disabled,
                 verbose=verbose,
                 console=console,
@@ -400,9 +593,10 @@ class UserPreferencesAgent:
                 width=width,
                 **kwargs,
             ),
-            self.analyze_rules_and_memories(
+            self._analyze_rules_and_memories(
                 msgs,
-                model=chat_model,
+                messages_instructions=messages_instructions,
+                chat_model=chat_model,
                 tracing_disabled=tracing_disabled,
                 verbose=verbose,
                 console=console,
@@ -425,22 +619,149 @@ class UserPreferencesAgent:
             usages=usages,
         )
 
+    async def _analyze_language(
+        self,
+        msgs: list[um.Message],
+        *,
+        messages_instructions: str,
+        chat_model: agents.OpenAIChatCompletionsModel | agents.OpenAIResponsesModel,
+        tracing_disabled: bool,
+        verbose: bool,
+        console: rich.console.Console,
+        color_rotator: RichColorRotator,
+        width: int,
+        **kwargs,
+    ) -> "UserPreferencesResult":
+        return await self._analyze(
+            msgs,
+            agent_name="user-preferences-agent-analyze-language",
+            template_source=self.instructions_analyze_language_j2,
+            render_kwargs={
+                "language_codes": _LANGUAGE_CODES_CSV,
+                "messages_instructions": messages_instructions,
+            },
+            parse=self._parse_user_preferences_language,
+            chat_model=chat_model,
+            tracing_disabled=tracing_disabled,
+            verbose=verbose,
+            console=console,
+            color_rotator=color_rotator,
+            width=width,
+        )
+
+    async def _analyze_rules_and_memories(
+        self,
+        msgs: list[um.Message],
+        *,
+        messages_instructions: str,
+        chat_model: agents.OpenAIChatCompletionsModel | agents.OpenAIResponsesModel,
+        tracing_disabled: bool,
+        verbose: bool,
+        console: rich.console.Console,
+        color_rotator: RichColorRotator,
+        width: int,
+        **kwargs,
+    ) -> "UserPreferencesResult":
+        return await self._analyze(
+            msgs,
+            agent_name="user-preferences-agent-rules-and-memories",
+            template_source=self.instructions_rules_and_memories_j2,
+            render_kwargs={
+                "messages_instructions": messages_instructions,
+            },
+            parse=self._parse_user_preferences_rules_and_memories,
+            chat_model=chat_model,
+            tracing_disabled=tracing_disabled,
+            verbose=verbose,
+            console=console,
+            color_rotator=color_rotator,
+            width=width,
+        )
+
+    async def _analyze_combined(
+        self,
+        msgs: list[um.Message],
+        *,
+        messages_instructions: str,
+        chat_model: agents.OpenAIChatCompletionsModel | agents.OpenAIResponsesModel,
+        tracing_disabled: bool,
+        verbose: bool,
+        console: rich.console.Console,
+        color_rotator: RichColorRotator,
+        width: int,
+        **kwargs,
+    ) -> "UserPreferencesResult":
+        return await self._analyze(
+            msgs,
+            agent_name="user-preferences-agent-analyze-combined",
+            template_source=self.instructions_analyze_combined_j2,
+            render_kwargs={
+                "language_codes": _LANGUAGE_CODES_CSV,
+                "messages_instructions": messages_instructions,
+            },
+            parse=self._parse_user_preferences_combined,
+            chat_model=chat_model,
+            tracing_disabled=tracing_disabled,
+            verbose=verbose,
+            console=console,
+            color_rotator=color_rotator,
+            width=width,
+        )
+
+    async def _analyze(
+        self,
+        msgs: list[um.Message],
+        *,
+        agent_name: str,
+        template_source: str,
+        render_kwargs: typing.Dict[str, typing.Any],
+        parse: typing.Callable[[str], UserPreferences],
+        chat_model: agents.OpenAIChatCompletionsModel | agents.OpenAIResponsesModel,
+        tracing_disabled: bool,
+        verbose: bool,
+        console: rich.console.Console,
+        color_rotator: RichColorRotator,
+        width: int,
+    ) -> "UserPreferencesResult":
+        user_input = _get_template(template_source).render(**render_kwargs)
+
+        if verbose:
+            _render_verbose(console, color_rotator, width, instructions=user_input)
+
+        agent = self._get_agent(agent_name, chat_model)
+        async with _get_llm_semaphore():
+            result = await agents.Runner.run(
+                agent,
+                user_input,
+                run_config=agents.RunConfig(tracing_disabled=tracing_disabled),
+            )
+        usage = _to_usage(result, chat_model)
+
+        if verbose:
+            _render_verbose(
+                console,
+                color_rotator,
+                width,
+                output=str(result.final_output),
+                usage=usage,
+            )
+
+        return UserPreferencesResult(
+            input_messages=msgs,
+            user_preferences=parse(str(result.final_output)),
+            usages=[usage],
+        )
+
     def _parse_user_preferences_language(
         self,
         text: str,
     ) -> UserPreferences:
-        pattern = re.compile(
-            r"\[([^\]]+)\]\s*\(\s*#\s*([^)]+?)\s*\)", flags=re.IGNORECASE
-        )
-        for m in pattern.finditer(text):
-            lang_expr = m.group(1)
-            lang_code_str = m.group(2)
-            break
-        else:
+        m = _LANG_RE.search(text)
+        lang_expr, lang_code_str = (m.group(1), m.group(2)) if m else (None, None)
+        if m is None:
             logger.error(f"No language expression found in the text: {text}")
-            lang_expr = None
-            lang_code_str = None
 
+        language: LanguageCodes | None = None
         if lang_code_str is not None:
             try:
                 language = LanguageCodes.from_might_common_name(lang_code_str)
@@ -456,20 +777,90 @@ class UserPreferencesAgent:
                 logger.error(f"Failed to parse language expression: {lang_expr}")
                 language = None
 
-        return UserPreferences(language=language)
+        return UserPreferences.model_construct(language=language)
 
     def _parse_user_preferences_rules_and_memories(
         self,
         text: str,
     ) -> UserPreferences:
-        pattern = re.compile(r"^rule:\s*(.+)", re.MULTILINE | re.IGNORECASE)
-        matches = pattern.findall(text)
+        matches = [match.strip() for match in _RULE_RE.findall(text)]
 
-        if len(matches) == 1 and matches[0].strip().lower() in ("none", "null"):
-            return UserPreferences(rules_and_memories=[])
+        if len(matches) == 1 and matches[0].lower() in _NONE_TOKENS:
+            return UserPreferences.model_construct(rules_and_memories=[])
 
-        rules_and_memories = [match.strip() for match in matches]
-        return UserPreferences(rules_and_memories=rules_and_memories)
+        return UserPreferences.model_construct(rules_and_memories=matches)
+
+    def _parse_user_preferences_combined(
+        self,
+        text: str,
+    ) -> UserPreferences:
+        # The prompt primes the language section, so text before the first
+        # task tag belongs to it. Repeated tags extend their section, and
+        # missing tags fall back to the full text.
+        parts = _TASK_TAG_RE.split(text)
+        sections: typing.Dict[str, str] = {"language": parts[0]}
+        for task, section in zip(parts[1::2], parts[2::2]):
+            key = task.lower()
+            sections[key] = sections.get(key, "") + "\n" + section
+
+        user_preferences = self._parse_user_preferences_language(
+            sections.get("language") or text
+        )
+        return user_preferences.merge(
+            self._parse_user_preferences_rules_and_memories(
+                sections.get("rules", text)
+            )
+        )
+
+    def _get_agent(
+        self,
+        name: str,
+        chat_model: agents.OpenAIChatCompletionsModel | agents.OpenAIResponsesModel,
+    ) -> agents.Agent:
+        key = (name, id(chat_model))
+        agent = self._agents.get(key)
+        if agent is None:
+            if len(self._agents) >= self.max_cached_agents:
+                self._agents.pop(next(iter(self._agents)))
+            agent = agents.Agent(
+                name=name,
+                model=chat_model,
+                model_settings=agents.ModelSettings(temperature=0.0),
+            )
+            self._agents[key] = agent
+        return agent
+
+    def _bind_loop(self) -> None:
+        """Drop loop-bound resources when called from a new event loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._openai_client is not None:
+                logger.warning(
+                    "Dropping an unclosed OpenAI client bound to a previous event "
+                    "loop; call aclose() before reusing the agent on a new loop"
+                )
+            self._loop = loop
+            self._openai_client = None
+            self._responses_models.clear()
+            self._agents.clear()
+
+    def _get_openai_client(self) -> openai.AsyncOpenAI:
+        """Return this agent's OpenAI client so its connection pool is reused."""
+        self._bind_loop()
+        if self._openai_client is None:
+            self._openai_client = openai.AsyncOpenAI()
+        return self._openai_client
+
+    def _responses_model_for(self, name: str) -> agents.OpenAIResponsesModel:
+        """Return a memoized responses model bound to this agent's client."""
+        openai_client = self._get_openai_client()
+        chat_model = self._responses_models.get(name)
+        if chat_model is None:
+            chat_model = agents.OpenAIResponsesModel(
+                model=name, openai_client=openai_client
+            )
+            self._responses_models[name] = chat_model
+        return chat_model
 
     def _to_chat_model(
         self,
@@ -484,11 +875,7 @@ class UserPreferencesAgent:
         model = DEFAULT_MODEL if model is None else model
 
         if isinstance(model, str):
-            openai_client = openai.AsyncOpenAI()
-            return agents.OpenAIResponsesModel(
-                model=model,
-                openai_client=openai_client,
-            )
+            return self._responses_model_for(model)
 
         else:
             return model